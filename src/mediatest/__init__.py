@@ -1,3 +1,5 @@
 def main():
     """Entry point for the application script"""
-    print("Call your main application code here")
+    from mediatest.mediatest import main
+
+    return main()
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import os
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from mediatest.records import FileRecordStore
+
+ALBUM_YEAR_PATTERN = re.compile(r"\[(\d{4})(?:-(\d{4}))?\]")
+
+# characters which can't be used in folder names (Windows, or prohibited by the
+# filesystem tests) and what they are replaced with, e.g. "AC/DC" => "AC_DC"
+FOLDER_NAME_REPLACEMENTS = {c: "_" for c in '/\\:*?"<>|’？'}
+
+
+def normalize_path(path: str) -> str:
+    """Normalizes a path for joining, e.g. NFD vs NFC unicode
+    (macOS) and redundant separators"""
+    return os.path.normcase(os.path.normpath(unicodedata.normalize("NFC", path)))
+
+
+def normalize_name(name: str) -> str:
+    return unicodedata.normalize("NFC", name).strip().casefold()
+
+
+def tag_to_folder_name(tag: str, replacements: Dict[str, str]) -> str:
+    """Folder name expected for a tag value, e.g. "AC/DC" => "AC_DC".
+    Trailing dots and spaces are dropped as Windows doesn't allow them."""
+    return tag.translate(str.maketrans(replacements)).rstrip(". ")
+
+
+def parse_album_dir_years(name: str) -> Optional[Tuple[int, int]]:
+    """Returns the (first, last) year from an album dir name,
+    e.g. "Album [1999]" => (1999, 1999), "Album [1999-2001]" => (1999, 2001)"""
+    matches = ALBUM_YEAR_PATTERN.findall(name)
+    if not matches:
+        return None
+    first, last = matches[-1]
+    return int(first), int(last or first)
+
+
+def crosscheck(
+    snapshot: FileRecordStore,
+    records: FileRecordStore,
+    exts: Iterable[str],
+    replacements: Optional[Dict[str, str]] = None,
+) -> List[str]:
+    """Joins a filesystem snapshot with files.yaml records on normalized path.
+    Reports layout/tag mismatches, media files missing from files.yaml and
+    files.yaml entries which no longer exist, in one linear pass.
+    Only media files (exts) and records located under snapshot.root are considered.
+    replacements maps characters not allowed in folder names (default:
+    FOLDER_NAME_REPLACEMENTS) and is applied to tags before comparing."""
+    errors: List[str] = []
+    if replacements is None:
+        replacements = FOLDER_NAME_REPLACEMENTS
+    exts = set(exts)
+    root = normalize_path(snapshot.root)
+    prefix = root.rstrip(os.path.sep) + os.path.sep
+
+    # hash index of files.yaml records belonging to this lib
+    index: Dict[str, int] = {}
+    for i in range(len(records)):
+        if records.ext(i) not in exts:
+            continue
+        key = normalize_path(records.path(i))
+        if key.startswith(prefix):
+            index[key] = i
+
+    for i in range(len(snapshot)):
+        if snapshot.ext(i) not in exts:
+            continue
+        path = snapshot.path(i)
+        j = index.pop(normalize_path(path), None)
+        if j is None:
+            errors.append(f"Missing from files.yaml: {path}")
+            continue
+        dirpath = snapshot.dir(i)
+        if snapshot.depth(dirpath) != 2:
+            # misplaced files are reported by the filesystem tests
+            continue
+        artist_dir, album_dir = dirpath.split(os.path.sep)
+        albumartist = records.tag(records.albumartists, j)
+        expected_dir = tag_to_folder_name(albumartist, replacements)
+        if normalize_name(artist_dir.rstrip(". ")) != normalize_name(expected_dir):
+            errors.append(
+                f"Artist folder {artist_dir!r} does not match albumartist tag "
+                + f"{albumartist!r}: {path}"
+            )
+        years = parse_album_dir_years(album_dir)
+        year = records.years[j]
+        if years is not None and not years[0] <= year <= years[1]:
+            errors.append(
+                f"Album folder year {album_dir!r} does not match year tag "
+                + f"{year}: {path}"
+            )
+
+    # whatever was not joined no longer exists on the filesystem
+    for j in sorted(index.values()):
+        errors.append(f"Stale files.yaml entry: {records.path(j)}")
+    return errors
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, Iterable, List, Optional, Tuple
+
+# format expected for each image file extension
+EXT_FORMATS = {"jpg": "JPEG", "jpeg": "JPEG", "png": "PNG", "webp": "WEBP"}
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# JPEG start of frame markers (excludes DHT 0xC4, JPG 0xC8 and DAC 0xCC)
+JPEG_SOF_MARKERS = {
+    0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF
+}
+# JPEG markers without a length field
+JPEG_STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7}
+
+
+@dataclass(frozen=True)
+class ImageInfo:
+    format: str  # "JPEG", "PNG" or "WEBP"
+    width: int
+    height: int
+
+
+def probe_png(f: BinaryIO) -> Optional[ImageInfo]:
+    # signature, IHDR length + type, then width and height
+    data = f.read(24)
+    if len(data) < 24 or data[:8] != PNG_SIGNATURE or data[12:16] != b"IHDR":
+        return None
+    width, height = struct.unpack(">II", data[16:24])
+    return ImageInfo("PNG", width, height)
+
+
+def probe_webp(f: BinaryIO) -> Optional[ImageInfo]:
+    data = f.read(30)
+    if len(data) < 30 or data[:4] != b"RIFF" or data[8:12] != b"WEBP":
+        return None
+    chunk = data[12:16]
+    if chunk == b"VP8 " and data[23:26] == b"\x9d\x01\x2a":
+        width, height = struct.unpack("<HH", data[26:30])
+        return ImageInfo("WEBP", width & 0x3FFF, height & 0x3FFF)
+    if chunk == b"VP8L" and data[20] == 0x2F:
+        bits = int.from_bytes(data[21:25], "little")
+        return ImageInfo("WEBP", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1)
+    if chunk == b"VP8X":
+        width = int.from_bytes(data[24:27], "little") + 1
+        height = int.from_bytes(data[27:30], "little") + 1
+        return ImageInfo("WEBP", width, height)
+    return None
+
+
+def probe_jpeg(f: BinaryIO) -> Optional[ImageInfo]:
+    """Walks the segment headers up to the first SOF marker,
+    seeking over segment payloads (e.g. EXIF thumbnails)"""
+    if f.read(2) != b"\xff\xd8":
+        return None
+    while True:
+        b = f.read(1)
+        if not b:
+            return None
+        if b != b"\xff":
+            # not at a marker, corrupt file
+            return None
+        marker = f.read(1)
+        while marker == b"\xff":  # fill bytes
+            marker = f.read(1)
+        if not marker:
+            return None
+        m = marker[0]
+        if m in JPEG_STANDALONE_MARKERS:
+            continue
+        if m in (0xD9, 0xDA):  # end of image / start of scan before any SOF
+            return None
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        (length,) = struct.unpack(">H", length_bytes)
+        if m in JPEG_SOF_MARKERS:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack(">HH", data[1:5])
+            return ImageInfo("JPEG", width, height)
+        f.seek(length - 2, 1)
+
+
+def probe_image(path: str) -> Optional[ImageInfo]:
+    """Determines image format and dimensions from the header bytes only,
+    without decoding the image. Returns None if not a JPEG, PNG or WebP."""
+    try:
+        with open(path, "rb") as f:
+            magic = f.read(12)
+            f.seek(0)
+            if magic[:2] == b"\xff\xd8":
+                return probe_jpeg(f)
+            if magic[:8] == PNG_SIGNATURE:
+                return probe_png(f)
+            if magic[:4] == b"RIFF" and magic[8:12] == b"WEBP":
+                return probe_webp(f)
+    except OSError:
+        pass
+    return None
+
+
+def probe_images(
+    files: Iterable[Tuple[str, int, int]],
+    cached: Optional[Dict[str, List]] = None,
+    max_workers: Optional[int] = None,
+) -> Dict[str, List]:
+    """Probes (path, size, mtime_ns) files in parallel.
+    Returns {path: [size, mtime_ns, format, width, height]} (format is "" if the
+    file could not be probed). Entries of cached with the same size and mtime
+    are reused instead of re-reading the file."""
+    cached = cached or {}
+    results: Dict[str, List] = {}
+    todo: List[Tuple[str, int, int]] = []
+    for path, size, mtime_ns in files:
+        prev = cached.get(path)
+        if prev is not None and prev[0] == size and prev[1] == mtime_ns:
+            results[path] = prev
+        else:
+            todo.append((path, size, mtime_ns))
+    # probing is I/O bound (a few small reads per file), threads are enough
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        infos = executor.map(probe_image, [path for path, _, _ in todo])
+        for (path, size, mtime_ns), info in zip(todo, infos):
+            if info is None:
+                results[path] = [size, mtime_ns, "", 0, 0]
+            else:
+                results[path] = [size, mtime_ns, info.format, info.width, info.height]
+    return results
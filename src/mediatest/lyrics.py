@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List
+
+from mediatest.records import FileRecordStore
+
+EXT_SYNCED = "lrc"
+EXT_UNSYNCED = "txt"
+
+
+@dataclass
+class AlbumLyrics:
+    """Lyrics coverage of a single album dir.
+    Media files are paired with lyrics files in the same dir by stem,
+    e.g. "01 - Song.mp3" <=> "01 - Song.lrc" """
+
+    album: str  # album dir, relative to the lib root
+    tracks: int = 0
+    synced: int = 0
+    unsynced: int = 0  # .txt but no .lrc
+    missing: List[str] = field(default_factory=list)  # media files without .lrc
+    orphans: List[str] = field(default_factory=list)  # lyrics files without media
+
+    @property
+    def coverage(self) -> float:
+        return self.synced / self.tracks if self.tracks else 1.0
+
+
+class LyricsIndex:
+    """Per-album lyrics coverage of a lib, built from a snapshot in one pass"""
+
+    def __init__(self, root: str, albums: Dict[str, AlbumLyrics]):
+        self.root = root
+        self.albums = albums
+
+    @classmethod
+    def build(cls, snapshot: FileRecordStore, media_exts: Iterable[str]) -> LyricsIndex:
+        media_exts = set(media_exts)
+        albums: Dict[str, AlbumLyrics] = {}
+        for album in snapshot.directory_paths():
+            entry = cls._pair(snapshot, album, media_exts)
+            if entry.tracks or entry.orphans:
+                albums[album] = entry
+        return cls(snapshot.root, albums)
+
+    @staticmethod
+    def _pair(snapshot: FileRecordStore, album: str, media_exts: set) -> AlbumLyrics:
+        media: List[str] = []
+        stems: Dict[str, List[str]] = {}  # e.g. "02" => ["02.m4a", "02.mp3"]
+        lyrics: Dict[str, List[str]] = {EXT_SYNCED: [], EXT_UNSYNCED: []}
+        for i in snapshot.files_in(album):
+            name = snapshot.name(i)
+            stem, ext = os.path.splitext(name)
+            ext = ext.strip(".")
+            if ext in media_exts:
+                media.append(name)
+                stems.setdefault(stem, []).append(name)
+            elif ext in lyrics:
+                lyrics[ext].append(stem)
+        synced = set(lyrics[EXT_SYNCED])
+        unsynced = set(lyrics[EXT_UNSYNCED])
+        entry = AlbumLyrics(album, tracks=len(media))
+        for name in sorted(media):
+            stem, _ = os.path.splitext(name)
+            if stem in synced:
+                entry.synced += 1
+            else:
+                entry.missing.append(name)
+                if stem in unsynced:
+                    entry.unsynced += 1
+        for ext, lyrics_stems in lyrics.items():
+            entry.orphans += [f"{s}.{ext}" for s in sorted(lyrics_stems) if s not in stems]
+        return entry
+
+    @property
+    def tracks(self) -> int:
+        return sum(a.tracks for a in self.albums.values())
+
+    @property
+    def synced(self) -> int:
+        return sum(a.synced for a in self.albums.values())
+
+    @property
+    def unsynced(self) -> int:
+        return sum(a.unsynced for a in self.albums.values())
+
+    def orphans(self) -> List[str]:
+        """Full paths of lyrics files without a matching media file"""
+        return [
+            os.path.join(self.root, a.album, name)
+            for a in self.albums.values()
+            for name in a.orphans
+        ]
+
+    def report(self) -> List[str]:
+        """Per-album coverage lines for albums missing synced lyrics"""
+        lines: List[str] = []
+        for album in sorted(self.albums):
+            a = self.albums[album]
+            if not a.missing:
+                continue
+            lines.append(
+                f"{album}: {a.synced}/{a.tracks} synced ({a.coverage:.0%}), "
+                + f"{a.unsynced} unsynced only"
+            )
+            lines += [f"    {name}" for name in a.missing]
+        lines.append(
+            f"total: {self.synced}/{self.tracks} synced "
+            + f"({self.synced / self.tracks if self.tracks else 1.0:.0%}), "
+            + f"{self.unsynced} unsynced only"
+        )
+        return lines
@@ -1,6 +1,133 @@
-def main():
+from __future__ import annotations
+
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+from typing import List, Optional
+
+from mediatest.records import FileRecordStore, snapshot_cache_path
+from mediatest.sync import check_fits, plan_sync
+
+# where the filesystem tests save the lib snapshots, i.e. pytest's
+# cache.mkdir("mediatest") when pytest is run from the current directory
+SNAPSHOT_CACHE_DIR = os.path.join(".pytest_cache", "d", "mediatest")
+
+
+def load_config():
+    """Imports tests/test_config.py from the current directory
+    (i.e. run mediatest from the same directory as pytest)"""
+    sys.path.insert(0, os.getcwd())
+    return importlib.import_module("tests.test_config")
+
+
+def load_source_snapshot(media_path: str, cache_dir: str, rescan: bool) -> FileRecordStore:
+    """Uses the snapshot saved by the last pytest run unless an artist or album
+    dir was added, removed or changed since, or a file was modified in place
+    (e.g. retagged), otherwise walks media_path"""
+    path = snapshot_cache_path(cache_dir, media_path)
+    if not rescan and os.path.isfile(path):
+        age_hours = (time.time() - os.path.getmtime(path)) / 3600
+        snapshot = FileRecordStore.load(path)
+        stale = snapshot.stale_dirs()
+        changed = [] if stale else snapshot.changed_files()
+        if not stale and not changed:
+            print(
+                f"Using cached snapshot {path} from {age_hours:.1f} hours ago "
+                + f"(use --rescan to walk {media_path})"
+            )
+            return snapshot
+        if stale:
+            print(f"Cached snapshot {path} is out of date ({len(stale)} dirs changed, e.g. {stale[0]})")
+        else:
+            print(f"Cached snapshot {path} is out of date ({len(changed)} files changed, e.g. {changed[0]})")
+    print(f"Scanning {media_path}")
+    snapshot = FileRecordStore.from_filesystem(media_path)
+    for error in snapshot.errors:
+        print(f"Skipped: {error}")
+    return snapshot
+
+
+def sync_plan(args: argparse.Namespace, config) -> int:
+    media_path = config.LIBS_MEDIA_PATH[args.lib_idx]
+    limit_bytes = config.LIBS_TOTAL_FILESIZE_LIMIT_GB[args.lib_idx] * config.GIGABYTE
+    if args.hash and not os.path.isdir(args.target):
+        print("--hash needs a mounted target directory, a manifest has no file contents")
+        return 2
+    try:
+        source = load_source_snapshot(media_path, args.cache_dir, args.rescan)
+        if os.path.isdir(args.target):
+            print(f"Scanning {args.target}")
+            target = FileRecordStore.from_filesystem(args.target)
+        else:
+            target = FileRecordStore.load(args.target)
+        plan = plan_sync(source, target, args.hash)
+    except (ValueError, OSError, json.JSONDecodeError) as e:
+        print(f"Unable to plan sync: {e}")
+        return 2
+    for line in plan.lines():
+        print(line)
+    print(
+        f"copy: {len(plan.copy)}, update: {len(plan.update)}, "
+        + f"delete: {len(plan.delete)}, unchanged: {plan.unchanged}"
+    )
+    print(f"bytes to copy: {plan.copy_bytes}, bytes freed: {plan.freed_bytes}")
+    print(f"size after sync: {plan.source_bytes / config.GIGABYTE:.2f} GB")
+    errors = check_fits(plan, limit_bytes, args.target)
+    for error in errors:
+        print(f"Does not fit: {error}")
+    if args.save_manifest is not None and not errors:
+        # manifest of the target as it will be after applying the plan,
+        # without a root as the files are on the device, not in the lib
+        source.save(args.save_manifest, root="")
+        print(f"Saved manifest {args.save_manifest}")
+    return 1 if errors else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="mediatest")
+    subparsers = parser.add_subparsers(dest="command")
+    p = subparsers.add_parser(
+        "sync-plan",
+        help="print the copy/delete plan to mirror a lib to a device",
+    )
+    p.add_argument("lib_idx", type=int, help="index into LIBS_MEDIA_PATH (0 = LIB1)")
+    p.add_argument(
+        "target", help="mounted target directory, or manifest file (see --save-manifest)"
+    )
+    p.add_argument(
+        "--hash",
+        action="store_true",
+        help="compare partial hashes of files with the same size but different mtime",
+    )
+    p.add_argument(
+        "--rescan", action="store_true", help="walk the lib instead of using the cached snapshot"
+    )
+    p.add_argument(
+        "--cache-dir",
+        default=SNAPSHOT_CACHE_DIR,
+        help=f"where pytest saved the lib snapshots (default: {SNAPSHOT_CACHE_DIR})",
+    )
+    p.add_argument(
+        "--save-manifest",
+        metavar="PATH",
+        help="save the synced target manifest, for devices that can't be mounted",
+    )
+    args = parser.parse_args(argv)
+    if args.command == "sync-plan":
+        config = load_config()
+        if args.lib_idx not in range(len(config.LIBS_MEDIA_PATH)):
+            # same as choices=, which needs the config before parsing
+            p.error(
+                f"argument lib_idx: invalid choice: {args.lib_idx} "
+                + f"(choose from 0 to {len(config.LIBS_MEDIA_PATH) - 1})"
+            )
+        return sync_plan(args, config)
     print("Usage: pytest .")
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
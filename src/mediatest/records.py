@@ -0,0 +1,445 @@
+from __future__ import annotations
+
+import json
+import os
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional
+
+
+def cache_name(media_path: str) -> str:
+    """File/key name for cached results of a lib, e.g. /data/Music/ => data_Music"""
+    return media_path.strip(os.path.sep).replace(os.path.sep, "_")
+
+
+def snapshot_cache_path(cache_dir: str, media_path: str) -> str:
+    return os.path.join(cache_dir, f"snapshot_{cache_name(media_path)}.json")
+
+
+class StringPool:
+    """Interns strings so that repeated values (artist, album, genre,
+    directory) are stored once and referenced by integer id"""
+
+    __slots__ = ("_ids", "_strings")
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._strings: List[str] = []
+
+    def intern(self, s: str) -> int:
+        i = self._ids.get(s)
+        if i is None:
+            i = len(self._strings)
+            self._ids[s] = i
+            self._strings.append(s)
+        return i
+
+    def lookup(self, s: str) -> Optional[int]:
+        return self._ids.get(s)
+
+    def __getitem__(self, i: int) -> str:
+        return self._strings[i]
+
+    def __len__(self) -> int:
+        return len(self._strings)
+
+    def to_list(self) -> List[str]:
+        return list(self._strings)
+
+    @classmethod
+    def from_list(cls, strings: List[str]) -> StringPool:
+        pool = cls()
+        pool._strings = list(strings)
+        pool._ids = {s: i for i, s in enumerate(pool._strings)}
+        return pool
+
+
+class FileRecord:
+    """Lightweight view of a single row in a FileRecordStore.
+    Exposes the same attribute names as mediascan's MediaFile"""
+
+    __slots__ = ("_store", "_idx")
+
+    def __init__(self, store: FileRecordStore, idx: int):
+        self._store = store
+        self._idx = idx
+
+    @property
+    def index(self) -> int:
+        return self._idx
+
+    @property
+    def path(self) -> str:
+        return self._store.path(self._idx)
+
+    @property
+    def relpath(self) -> str:
+        return self._store.relpath(self._idx)
+
+    @property
+    def dir(self) -> str:
+        return self._store.dir(self._idx)
+
+    @property
+    def name(self) -> str:
+        return self._store.name(self._idx)
+
+    @property
+    def ext(self) -> str:
+        return self._store.ext(self._idx)
+
+    @property
+    def size(self) -> int:
+        return self._store.sizes[self._idx]
+
+    @property
+    def mtime_ns(self) -> int:
+        return self._store.mtimes[self._idx]
+
+    @property
+    def year(self) -> int:
+        years = self._store.years
+        return years[self._idx] if years is not None else 0
+
+    @property
+    def artist(self) -> str:
+        return self._store.tag(self._store.artists, self._idx)
+
+    @property
+    def albumartist(self) -> str:
+        return self._store.tag(self._store.albumartists, self._idx)
+
+    @property
+    def album(self) -> str:
+        return self._store.tag(self._store.albums, self._idx)
+
+    @property
+    def title(self) -> str:
+        return self._store.tag(self._store.titles, self._idx)
+
+    @property
+    def genre(self) -> str:
+        return self._store.tag(self._store.genres, self._idx)
+
+    def __repr__(self) -> str:
+        return (
+            f"FileRecord(path={self.path!r}, size={self.size}, year={self.year}, "
+            + f"artist={self.artist!r}, albumartist={self.albumartist!r}, "
+            + f"album={self.album!r}, title={self.title!r}, genre={self.genre!r})"
+        )
+
+
+class FileRecordStore:
+    """Column-oriented store of file records.
+    Strings are interned in a shared StringPool and numeric columns are kept in
+    typed arrays, so a record costs a few dozen bytes instead of a Python object
+    with a __dict__. Directories are stored relative to root."""
+
+    # typed array columns, in the order they are saved
+    COLUMNS = (
+        "dirs",
+        "names",
+        "sizes",
+        "mtimes",
+        "directories",
+        "dir_mtimes",
+    )
+    # ID3 tag columns, only allocated for stores with tags (e.g. files.yaml)
+    TAG_COLUMNS = (
+        "years",
+        "artists",
+        "albumartists",
+        "albums",
+        "titles",
+        "genres",
+    )
+
+    __slots__ = (
+        "root",
+        "strings",
+        "dirs",
+        "names",
+        "sizes",
+        "mtimes",
+        "years",
+        "artists",
+        "albumartists",
+        "albums",
+        "titles",
+        "genres",
+        "directories",
+        "dir_mtimes",
+        "errors",
+        "_by_dir",
+        "_subdirs",
+    )
+
+    def __init__(self, root: str = "", tags: bool = False):
+        self.root = root
+        self.strings = StringPool()
+        self.dirs = array("I")
+        self.names = array("I")
+        self.sizes = array("q")
+        self.mtimes = array("q")  # nanoseconds
+        # filesystem snapshots have no tags, tag columns stay None
+        self.years: Optional[array] = array("i") if tags else None
+        self.artists: Optional[array] = array("I") if tags else None
+        self.albumartists: Optional[array] = array("I") if tags else None
+        self.albums: Optional[array] = array("I") if tags else None
+        self.titles: Optional[array] = array("I") if tags else None
+        self.genres: Optional[array] = array("I") if tags else None
+        # every directory below root, including empty ones
+        self.directories = array("I")
+        self.dir_mtimes = array("q")  # nanoseconds
+        # entries which could not be read, e.g. dangling symlinks
+        self.errors: List[str] = []
+        self._by_dir: Optional[Dict[int, List[int]]] = None
+        self._subdirs: Optional[Dict[str, List[str]]] = None
+
+    def add_dir(self, dirpath: str, mtime_ns: int = 0) -> int:
+        i = self.strings.intern(dirpath)
+        self.directories.append(i)
+        self.dir_mtimes.append(mtime_ns)
+        self._subdirs = None
+        return i
+
+    def add_file(
+        self,
+        dirpath: str,
+        name: str,
+        size: int,
+        mtime_ns: int = 0,
+        year: int = 0,
+        artist: str = "",
+        albumartist: str = "",
+        album: str = "",
+        title: str = "",
+        genre: str = "",
+    ) -> int:
+        intern = self.strings.intern
+        self.dirs.append(intern(dirpath))
+        self.names.append(intern(name))
+        self.sizes.append(size)
+        self.mtimes.append(mtime_ns)
+        if self.has_tags:
+            self.years.append(year)
+            self.artists.append(intern(artist))
+            self.albumartists.append(intern(albumartist))
+            self.albums.append(intern(album))
+            self.titles.append(intern(title))
+            self.genres.append(intern(genre))
+        self._by_dir = None
+        return len(self.sizes) - 1
+
+    @property
+    def has_tags(self) -> bool:
+        return self.years is not None
+
+    def tag(self, column: Optional[array], idx: int) -> str:
+        """String value of a tag column, "" for stores without tags"""
+        return self.strings[column[idx]] if column is not None else ""
+
+    def __len__(self) -> int:
+        return len(self.sizes)
+
+    def __getitem__(self, idx: int) -> FileRecord:
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return FileRecord(self, idx)
+
+    def __iter__(self) -> Iterator[FileRecord]:
+        for i in range(len(self)):
+            yield FileRecord(self, i)
+
+    def dir(self, idx: int) -> str:
+        return self.strings[self.dirs[idx]]
+
+    def name(self, idx: int) -> str:
+        return self.strings[self.names[idx]]
+
+    def ext(self, idx: int) -> str:
+        _, ext = os.path.splitext(self.name(idx))
+        return ext.strip(".")
+
+    def relpath(self, idx: int) -> str:
+        return os.path.join(self.dir(idx), self.name(idx))
+
+    def path(self, idx: int) -> str:
+        return os.path.join(self.root, self.dir(idx), self.name(idx))
+
+    def fullpath(self, dirpath: str) -> str:
+        """Joins a relative directory with root"""
+        return os.path.join(self.root, dirpath)
+
+    def total_size(self) -> int:
+        return sum(self.sizes)
+
+    def directory_paths(self) -> List[str]:
+        return [self.strings[i] for i in self.directories]
+
+    def files_in(self, dirpath: str) -> List[int]:
+        """Returns indices of the files directly inside dirpath"""
+        if self._by_dir is None:
+            by_dir: Dict[int, List[int]] = {}
+            for i, d in enumerate(self.dirs):
+                by_dir.setdefault(d, []).append(i)
+            self._by_dir = by_dir
+        d = self.strings.lookup(dirpath)
+        if d is None:
+            return []
+        return self._by_dir.get(d, [])
+
+    def subdirs_of(self, dirpath: str) -> List[str]:
+        """Returns the relative paths of directories directly inside dirpath"""
+        if self._subdirs is None:
+            subdirs: Dict[str, List[str]] = {}
+            for d in self.directory_paths():
+                subdirs.setdefault(os.path.dirname(d), []).append(d)
+            self._subdirs = subdirs
+        return self._subdirs.get(dirpath, [])
+
+    @staticmethod
+    def depth(dirpath: str) -> int:
+        """Depth of a relative directory, 1 = artist dir, 2 = album dir"""
+        return len(dirpath.split(os.path.sep)) if dirpath else 0
+
+    def save(self, path: str, root: Optional[str] = None):
+        """Saves the store as JSON, e.g. as a cached snapshot or device manifest.
+        root overrides the saved root, e.g. "" for a manifest of another device."""
+        data = {
+            "root": self.root if root is None else root,
+            "strings": self.strings.to_list(),
+            "columns": {
+                c: getattr(self, c).tolist()
+                for c in self.COLUMNS + (self.TAG_COLUMNS if self.has_tags else ())
+            },
+        }
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> FileRecordStore:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        tags = all(c in data["columns"] for c in cls.TAG_COLUMNS)
+        store = cls(data["root"], tags)
+        store.strings = StringPool.from_list(data["strings"])
+        for c in cls.COLUMNS + (cls.TAG_COLUMNS if tags else ()):
+            column = getattr(store, c)
+            column.fromlist(data["columns"][c])
+        return store
+
+    def stale_dirs(self, max_depth: int = 2) -> List[str]:
+        """Compares the snapshot with root, down to max_depth (2 = album dirs).
+        Returns the dirs which were added, removed or whose mtime changed,
+        i.e. where files were added, removed or renamed since the snapshot.
+        Files modified in place are not detected."""
+        expected = {
+            self.strings[d]: mtime_ns
+            for d, mtime_ns in zip(self.directories, self.dir_mtimes)
+            if self.depth(self.strings[d]) <= max_depth
+        }
+        stale: List[str] = []
+        stack = [""]
+        while stack:
+            rel = stack.pop()
+            try:
+                with os.scandir(os.path.join(self.root, rel)) as it:
+                    entries = [e for e in it if e.is_dir()]
+            except OSError:
+                continue
+            for entry in entries:
+                entry_rel = os.path.join(rel, entry.name) if rel else entry.name
+                try:
+                    mtime_ns = entry.stat().st_mtime_ns
+                except OSError:
+                    continue
+                if expected.pop(entry_rel, None) != mtime_ns:
+                    stale.append(entry_rel)
+                if self.depth(entry_rel) < max_depth and not entry.is_symlink():
+                    stack.append(entry_rel)
+        return sorted(stale + list(expected))
+
+    def changed_files(self) -> List[str]:
+        """Stats every file of the snapshot, returns the relative paths of files
+        which were removed or modified in place (e.g. retagged) since the snapshot,
+        which stale_dirs can't detect as the dir mtime doesn't change"""
+        changed: List[str] = []
+        for i in range(len(self)):
+            try:
+                st = os.stat(self.path(i))
+            except OSError:
+                changed.append(self.relpath(i))
+                continue
+            if st.st_size != self.sizes[i] or st.st_mtime_ns != self.mtimes[i]:
+                changed.append(self.relpath(i))
+        return changed
+
+    @classmethod
+    def from_filesystem(cls, media_path: str) -> FileRecordStore:
+        """Builds a snapshot of media_path with a single scandir walk.
+        Raises OSError if media_path itself can't be read, entries below it
+        which can't be read are recorded in errors instead."""
+        store = cls(media_path)
+        with os.scandir(media_path) as it:
+            entries = sorted(it, key=lambda e: e.name)
+        stack = [("", entries)]
+        while stack:
+            rel, entries = stack.pop()
+            for entry in entries:
+                entry_rel = os.path.join(rel, entry.name) if rel else entry.name
+                try:
+                    if entry.is_dir():
+                        store.add_dir(entry_rel, entry.stat().st_mtime_ns)
+                        # like os.walk, symlinked dirs are listed but not followed
+                        if not entry.is_symlink():
+                            with os.scandir(entry.path) as it:
+                                stack.append((entry_rel, sorted(it, key=lambda e: e.name)))
+                    else:
+                        st = entry.stat()
+                        store.add_file(rel, entry.name, st.st_size, st.st_mtime_ns)
+                except OSError as e:
+                    store.errors.append(f"{e.strerror}: {entry.path}")
+        return store
+
+    @classmethod
+    def from_media_files(cls, files: Iterable) -> FileRecordStore:
+        """Builds a store from mediascan MediaFile objects (e.g. files.yaml).
+        Paths are kept absolute, i.e. root is empty."""
+        store = cls(tags=True)
+        for f in files:
+            dirpath, name = os.path.split(f.path)
+            store.add_file(
+                dirpath,
+                name,
+                int(f.size or 0),
+                int(getattr(f, "mtime_ns", 0) or 0),
+                int(f.year or 0),
+                f.artist or "",
+                f.albumartist or "",
+                f.album or "",
+                f.title or "",
+                f.genre or "",
+            )
+        return store
+
+
+# snapshots walked by this process, by media path
+_snapshots: Dict[str, FileRecordStore] = {}
+
+
+def get_snapshot(media_path: str) -> FileRecordStore:
+    """Walks media_path once per process, all rules query the same snapshot"""
+    snapshot = _snapshots.get(media_path)
+    if snapshot is None:
+        snapshot = _snapshots[media_path] = FileRecordStore.from_filesystem(media_path)
+    return snapshot
+
+
+def loaded_snapshots() -> Dict[str, FileRecordStore]:
+    """Snapshots walked by get_snapshot so far, e.g. to save them after a run"""
+    return dict(_snapshots)
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from mediatest.crosscheck import normalize_path
+from mediatest.records import FileRecordStore
+
+# FAT/exFAT (e.g. sd cards) only store mtimes with 2 second resolution
+MTIME_TOLERANCE_NS = 2 * 10**9
+# bytes read from the start and from the end of a file for a partial hash
+PARTIAL_HASH_CHUNK = 64 * 1024
+
+
+def partial_hash(path: str, size: int) -> str:
+    """Hashes the first and last PARTIAL_HASH_CHUNK bytes and the size,
+    enough to tell retagged/re-encoded media files apart without reading
+    the whole file"""
+    h = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, "rb") as f:
+        h.update(f.read(PARTIAL_HASH_CHUNK))
+        if size > 2 * PARTIAL_HASH_CHUNK:
+            f.seek(-PARTIAL_HASH_CHUNK, os.SEEK_END)
+            h.update(f.read(PARTIAL_HASH_CHUNK))
+    return h.hexdigest()
+
+
+@dataclass
+class SyncPlan:
+    """Minimal set of operations to make target mirror source.
+    Paths are relative to the source/target roots."""
+
+    copy: List[Tuple[str, int]] = field(default_factory=list)  # new files
+    update: List[Tuple[str, int]] = field(default_factory=list)  # changed files
+    delete: List[Tuple[str, int]] = field(default_factory=list)  # extra files
+    unchanged: int = 0
+    source_bytes: int = 0  # total size of the target after syncing
+    target_bytes: int = 0  # total size of the target before syncing
+
+    @property
+    def copy_bytes(self) -> int:
+        return sum(size for _, size in self.copy + self.update)
+
+    @property
+    def freed_bytes(self) -> int:
+        """Bytes freed on the target by deletes and by files being replaced"""
+        return self.target_bytes - (self.source_bytes - self.copy_bytes)
+
+    def lines(self) -> List[str]:
+        return (
+            [f"delete {path}" for path, _ in self.delete]
+            + [f"update {path}" for path, _ in self.update]
+            + [f"copy {path}" for path, _ in self.copy]
+        )
+
+
+def plan_sync(
+    source: FileRecordStore, target: FileRecordStore, use_hash: bool = False
+) -> SyncPlan:
+    """Joins source and target on normalized relative path in one pass.
+    Files are considered unchanged if size and mtime match. With use_hash, files
+    with the same size but a different mtime are compared by partial hash,
+    which needs both source and target to be mounted, distinct directories
+    (raises ValueError otherwise, e.g. for a manifest target)."""
+    if use_hash and not can_hash(source, target):
+        raise ValueError(f"partial hashes need a mounted target directory, not {target.root!r}")
+    plan = SyncPlan(source_bytes=source.total_size(), target_bytes=target.total_size())
+    index: Dict[str, int] = {}
+    for j in range(len(target)):
+        index[normalize_path(target.relpath(j))] = j
+    for i in range(len(source)):
+        relpath = source.relpath(i)
+        size = source.sizes[i]
+        j = index.pop(normalize_path(relpath), None)
+        if j is None:
+            plan.copy.append((relpath, size))
+            continue
+        if target.sizes[j] == size and (
+            not target.mtimes[j]
+            or abs(target.mtimes[j] - source.mtimes[i]) <= MTIME_TOLERANCE_NS
+            or (use_hash and same_partial_hash(source, i, target, j))
+        ):
+            plan.unchanged += 1
+        else:
+            plan.update.append((relpath, size))
+    for j in sorted(index.values()):
+        plan.delete.append((target.relpath(j), target.sizes[j]))
+    return plan
+
+
+def can_hash(source: FileRecordStore, target: FileRecordStore) -> bool:
+    return (
+        os.path.isdir(source.root)
+        and os.path.isdir(target.root)
+        and normalize_path(os.path.abspath(source.root)) != normalize_path(os.path.abspath(target.root))
+    )
+
+
+def same_partial_hash(
+    source: FileRecordStore, i: int, target: FileRecordStore, j: int
+) -> bool:
+    try:
+        return partial_hash(source.path(i), source.sizes[i]) == partial_hash(
+            target.path(j), target.sizes[j]
+        )
+    except OSError:
+        return False
+
+
+def check_fits(
+    plan: SyncPlan, limit_bytes: int, target_path: Optional[str] = None
+) -> List[str]:
+    """Returns the reasons the synced target wouldn't fit (empty if it fits).
+    If target_path is a mounted directory its free space is checked as well,
+    assuming deletes are applied before copies."""
+    errors: List[str] = []
+    if plan.source_bytes > limit_bytes:
+        errors.append(
+            f"synced size {plan.source_bytes} bytes exceeds the limit of "
+            + f"{limit_bytes} bytes"
+        )
+    if target_path is not None and os.path.isdir(target_path):
+        free = shutil.disk_usage(target_path).free + plan.freed_bytes
+        if plan.copy_bytes > free:
+            errors.append(
+                f"copying {plan.copy_bytes} bytes needs more than the "
+                + f"{free} bytes available on {target_path}"
+            )
+    return errors
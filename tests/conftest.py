@@ -0,0 +1,13 @@
+from mediatest.records import loaded_snapshots, snapshot_cache_path
+
+
+def pytest_sessionfinish(session):
+    """Saves the lib snapshots walked during the session to
+    .pytest_cache/d/mediatest, for `mediatest sync-plan`"""
+    cache = getattr(session.config, "cache", None)
+    snapshots = loaded_snapshots()
+    if cache is None or not snapshots:
+        return
+    cache_dir = str(cache.mkdir("mediatest"))
+    for media_path, snapshot in snapshots.items():
+        snapshot.save(snapshot_cache_path(cache_dir, media_path))
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from mediascan import Genre
 
-from typing import List
+from typing import Dict, List
 
 from datetime import datetime
 
@@ -23,7 +23,19 @@ EXTS_ART = [
     "png",
     "xcf",
 ]  # intentionally lowercase for consistency, ".JPG" not allowed, etc.
+# Characters which can't be used in folder names are replaced with "_" before
+# comparing artist folders with albumartist tags (e.g. "AC/DC" => "AC_DC"),
+# override the replacement per character here, e.g. {"?": ""}
+FOLDER_NAME_REPLACEMENT_OVERRIDES: Dict[str, str] = {}
+# cover.jpg (and other cover art) dimension limits in pixels
+# checked by reading the image headers, see test_cover_art
+COVER_MIN_DIMENSION = 500
+COVER_MAX_DIMENSION = 3000
+COVER_MAX_FILESIZE = 5 * MEGABYTE
 EXTS_LYRICS = ["lrc", "txt"]
+# Set to True to fail test_lyrics_coverage on .lrc/.txt files without a matching
+# media file (by default they are only reported, e.g. loose .txt notes)
+LYRICS_FAIL_ON_ORPHANS = False
 EXTS_METADATA = ["yaml"]
 EXTS_EXTRA = ["pdf"]  # some albums include pdf booklets
 ALLOWED_EXTS = EXTS_MEDIA + EXTS_ART + EXTS_LYRICS + EXTS_METADATA + EXTS_EXTRA
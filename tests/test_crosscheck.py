@@ -0,0 +1,110 @@
+import os
+
+from mediatest.crosscheck import crosscheck, parse_album_dir_years, tag_to_folder_name, FOLDER_NAME_REPLACEMENTS
+from mediatest.records import FileRecordStore
+
+EXTS_MEDIA = ["mp3", "m4a"]
+
+
+def build(root: str, files):
+    """Snapshot of root and files.yaml records for the same
+    (relative dir, name, year, albumartist) files"""
+    snapshot = FileRecordStore(root)
+    records = FileRecordStore(tags=True)
+    for dirpath, name, year, albumartist in files:
+        snapshot.add_file(dirpath, name, 1000)
+        records.add_file(os.path.join(root, dirpath), name, 1000, year=year, albumartist=albumartist)
+    return snapshot, records
+
+
+def test_crosscheck_ok(tmp_path):
+    root = str(tmp_path / "Music") + os.path.sep
+    snapshot, records = build(
+        root,
+        [
+            ("Prince/Purple Rain [1984]", "01.mp3", 1984, "Prince"),
+            ("prince/1999 [1982]", "01.m4a", 1982, "Prince"),  # case-insensitive
+            ("Prince/1999 [1982]", "cover.jpg", 0, ""),  # not a media file
+        ],
+    )
+    assert crosscheck(snapshot, records, EXTS_MEDIA) == []
+
+
+def test_crosscheck_tag_mismatch(tmp_path):
+    root = str(tmp_path / "Music")
+    snapshot, records = build(
+        root,
+        [
+            ("Daft Punk/Discovery [2001]", "01.mp3", 2001, "Daft Punk!"),
+            ("Prince/1999 [1982]", "01.mp3", 1983, "Prince"),
+        ],
+    )
+    errors = crosscheck(snapshot, records, EXTS_MEDIA)
+    assert len(errors) == 2
+    assert errors[0].startswith("Artist folder 'Daft Punk' does not match albumartist tag 'Daft Punk!'")
+    assert errors[1].startswith("Album folder year '1999 [1982]' does not match year tag 1983")
+
+
+def test_crosscheck_year_range(tmp_path):
+    root = str(tmp_path / "Music")
+    snapshot, records = build(
+        root,
+        [
+            ("Queen/Greatest Hits [1974-1981]", "01.mp3", 1974, "Queen"),
+            ("Queen/Greatest Hits [1974-1981]", "02.mp3", 1981, "Queen"),
+            ("Queen/Greatest Hits [1974-1981]", "03.mp3", 1982, "Queen"),
+        ],
+    )
+    errors = crosscheck(snapshot, records, EXTS_MEDIA)
+    assert len(errors) == 1 and "year tag 1982" in errors[0]
+    assert parse_album_dir_years("Greatest Hits [1974-1981]") == (1974, 1981)
+    assert parse_album_dir_years("Live [Disc 2] [1999]") == (1999, 1999)
+    assert parse_album_dir_years("No Year") is None
+
+
+def test_crosscheck_folder_name_replacements(tmp_path):
+    root = str(tmp_path / "Music")
+    snapshot, records = build(
+        root,
+        [
+            ("AC_DC/Back in Black [1980]", "01.mp3", 1980, "AC/DC"),
+            ("Who_/Album [1970]", "01.mp3", 1970, "Who?"),
+            ("R.E.M/Murmur [1983]", "01.mp3", 1983, "R.E.M."),
+        ],
+    )
+    assert crosscheck(snapshot, records, EXTS_MEDIA) == []
+    replacements = {**FOLDER_NAME_REPLACEMENTS, "?": ""}
+    assert tag_to_folder_name("Who?", replacements) == "Who"
+    assert len(crosscheck(snapshot, records, EXTS_MEDIA, replacements)) == 1
+
+
+def test_crosscheck_missing_and_stale(tmp_path):
+    root = str(tmp_path / "Music")
+    snapshot, records = build(root, [("A/B [2000]", "01.mp3", 2000, "A")])
+    snapshot.add_file("A/B [2000]", "02.mp3", 1000)
+    snapshot.add_file("A/B [2000]", "02.lrc", 10)  # not a media file, not expected in files.yaml
+    records.add_file(os.path.join(root, "A/B [2000]"), "03.mp3", 1000, year=2000, albumartist="A")
+    errors = crosscheck(snapshot, records, EXTS_MEDIA)
+    assert errors == [
+        "Missing from files.yaml: " + os.path.join(root, "A/B [2000]", "02.mp3"),
+        "Stale files.yaml entry: " + os.path.join(root, "A/B [2000]", "03.mp3"),
+    ]
+
+
+def test_crosscheck_only_records_under_root(tmp_path):
+    root = str(tmp_path / "Music")
+    snapshot, records = build(root, [("A/B [2000]", "01.mp3", 2000, "A")])
+    # other libs, including one sharing the root's prefix, aren't stale
+    records.add_file(str(tmp_path / "MusicOther" / "C" / "D [2001]"), "01.mp3", 1000, year=2001, albumartist="C")
+    records.add_file(str(tmp_path / "Other" / "E"), "01.mp3", 1000)
+    assert crosscheck(snapshot, records, EXTS_MEDIA) == []
+
+
+def test_crosscheck_unicode_normalization(tmp_path):
+    root = str(tmp_path / "Music")
+    snapshot = FileRecordStore(root)
+    records = FileRecordStore(tags=True)
+    # NFD on disk (e.g. macOS), NFC in files.yaml
+    snapshot.add_file("Beyoncé/B [2003]", "01.mp3", 1000)
+    records.add_file(os.path.join(root, "Beyoncé/B [2003]"), "01.mp3", 1000, year=2003, albumartist="Beyoncé")
+    assert crosscheck(snapshot, records, EXTS_MEDIA) == []
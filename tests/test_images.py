@@ -0,0 +1,108 @@
+import struct
+import zlib
+
+from mediatest.images import EXT_FORMATS, ImageInfo, probe_image, probe_images
+
+
+def segment(marker: int, payload: bytes) -> bytes:
+    return bytes([0xFF, marker]) + struct.pack(">H", len(payload) + 2) + payload
+
+
+def jpeg(width: int, height: int, sof: int = 0xC0, before_sof: bytes = b"") -> bytes:
+    sof_payload = struct.pack(">BHHB", 8, height, width, 3) + b"\x01\x22\x00\x02\x11\x01\x03\x11\x01"
+    return b"\xff\xd8" + before_sof + segment(sof, sof_payload) + b"\xff\xda\x00\x02" + b"\x00" * 16 + b"\xff\xd9"
+
+
+def png(width: int, height: int) -> bytes:
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" + ihdr + struct.pack(">I", zlib.crc32(b"IHDR" + ihdr))
+    )
+
+
+def webp(chunk: bytes, payload: bytes) -> bytes:
+    data = chunk + struct.pack("<I", len(payload)) + payload
+    return b"RIFF" + struct.pack("<I", len(data) + 4) + b"WEBP" + data
+
+
+def write(tmp_path, name: str, data: bytes) -> str:
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_probe_jpeg_baseline(tmp_path):
+    assert probe_image(write(tmp_path, "a.jpg", jpeg(600, 400))) == ImageInfo("JPEG", 600, 400)
+
+
+def test_probe_jpeg_appn_before_sof(tmp_path):
+    # JFIF APP0, a large EXIF APP1 (e.g. with a thumbnail) and a DHT (0xC4 is not a SOF)
+    before_sof = (
+        segment(0xE0, b"JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00")
+        + segment(0xE1, b"Exif\x00\x00" + b"\xff\xc0" * 20000)
+        + segment(0xC4, b"\x00" * 29)
+    )
+    path = write(tmp_path, "a.jpg", jpeg(1400, 1200, before_sof=before_sof))
+    assert probe_image(path) == ImageInfo("JPEG", 1400, 1200)
+
+
+def test_probe_jpeg_progressive(tmp_path):
+    assert probe_image(write(tmp_path, "a.jpg", jpeg(800, 800, sof=0xC2))) == ImageInfo("JPEG", 800, 800)
+
+
+def test_probe_jpeg_truncated(tmp_path):
+    data = jpeg(600, 600, before_sof=segment(0xE0, b"JFIF\x00" + b"\x00" * 9))
+    assert probe_image(write(tmp_path, "a.jpg", data[:10])) is None
+    # cut inside the SOF segment
+    assert probe_image(write(tmp_path, "b.jpg", data[: data.index(b"\xff\xc0") + 6])) is None
+
+
+def test_probe_jpeg_corrupt(tmp_path):
+    assert probe_image(write(tmp_path, "a.jpg", b"\xff\xd8" + b"\x00" * 64)) is None
+    # start of scan before any SOF
+    assert probe_image(write(tmp_path, "b.jpg", b"\xff\xd8\xff\xda\x00\x02" + b"\x00" * 16)) is None
+
+
+def test_probe_png(tmp_path):
+    assert probe_image(write(tmp_path, "a.png", png(1000, 500))) == ImageInfo("PNG", 1000, 500)
+    assert probe_image(write(tmp_path, "b.png", png(1000, 500)[:20])) is None
+
+
+def test_probe_webp_lossy(tmp_path):
+    payload = b"\x00\x00\x00" + b"\x9d\x01\x2a" + struct.pack("<HH", 640, 480) + b"\x00" * 8
+    assert probe_image(write(tmp_path, "a.webp", webp(b"VP8 ", payload))) == ImageInfo("WEBP", 640, 480)
+
+
+def test_probe_webp_lossless(tmp_path):
+    bits = (1200 - 1) | ((900 - 1) << 14)
+    payload = b"\x2f" + struct.pack("<I", bits) + b"\x00" * 8
+    assert probe_image(write(tmp_path, "a.webp", webp(b"VP8L", payload))) == ImageInfo("WEBP", 1200, 900)
+
+
+def test_probe_webp_extended(tmp_path):
+    payload = b"\x10\x00\x00\x00" + (3000 - 1).to_bytes(3, "little") + (2000 - 1).to_bytes(3, "little")
+    assert probe_image(write(tmp_path, "a.webp", webp(b"VP8X", payload))) == ImageInfo("WEBP", 3000, 2000)
+
+
+def test_probe_mislabeled(tmp_path):
+    info = probe_image(write(tmp_path, "cover.jpg", png(600, 600)))
+    assert info == ImageInfo("PNG", 600, 600)
+    assert info.format != EXT_FORMATS["jpg"]
+    assert probe_image(write(tmp_path, "notes.jpg", b"not an image")) is None
+
+
+def test_probe_images_cache(tmp_path):
+    a = write(tmp_path, "a.jpg", jpeg(600, 600))
+    b = write(tmp_path, "b.png", png(700, 700))
+    cached = {
+        # same (size, mtime) => reused without reading the file
+        a: [10, 1, "PNG", 1, 1],
+        # different mtime => probed again
+        b: [20, 1, "JPEG", 2, 2],
+    }
+    results = probe_images([(a, 10, 1), (b, 20, 2)], cached)
+    assert results[a] == [10, 1, "PNG", 1, 1]
+    assert results[b] == [20, 2, "PNG", 700, 700]
+    # missing file is reported as not probed
+    missing = str(tmp_path / "missing.jpg")
+    assert probe_images([(missing, 0, 0)])[missing] == [0, 0, "", 0, 0]
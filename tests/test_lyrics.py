@@ -0,0 +1,54 @@
+import os
+
+from mediatest.lyrics import LyricsIndex
+from mediatest.records import FileRecordStore
+
+ALBUM = os.path.join("A", "Alb [2000]")
+EXTS_MEDIA = ["mp3", "m4a", "flac"]
+
+
+def build(tmp_path, names):
+    root = str(tmp_path / "lib")
+    for name in names:
+        path = os.path.join(root, ALBUM, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "wb").close()
+    return LyricsIndex.build(FileRecordStore.from_filesystem(root), EXTS_MEDIA)
+
+
+def test_lyrics_pairing(tmp_path):
+    index = build(
+        tmp_path,
+        ["01 - One.mp3", "01 - One.lrc", "02 - Two.mp3", "02 - Two.txt", "03 - Three.mp3", "cover.jpg"],
+    )
+    album = index.albums[ALBUM]
+    assert (album.tracks, album.synced, album.unsynced) == (3, 1, 1)
+    assert album.missing == ["02 - Two.mp3", "03 - Three.mp3"]
+    assert album.orphans == []
+    assert (index.tracks, index.synced, index.unsynced) == (3, 1, 1)
+    assert index.report()[0] == f"{ALBUM}: 1/3 synced (33%), 1 unsynced only"
+    assert index.report()[-1] == "total: 1/3 synced (33%), 1 unsynced only"
+
+
+def test_lyrics_same_stem(tmp_path):
+    # e.g. the lossy copy of a track next to the original, both count
+    index = build(tmp_path, ["02.flac", "02.m4a", "02.lrc", "03.flac", "03.m4a"])
+    album = index.albums[ALBUM]
+    assert (album.tracks, album.synced) == (4, 2)
+    assert album.missing == ["03.flac", "03.m4a"]
+    assert album.orphans == []
+
+
+def test_lyrics_orphans(tmp_path):
+    index = build(tmp_path, ["01.mp3", "01.lrc", "02.lrc", "03.txt"])
+    assert index.albums[ALBUM].orphans == ["02.lrc", "03.txt"]
+    assert index.orphans() == [
+        os.path.join(str(tmp_path / "lib"), ALBUM, "02.lrc"),
+        os.path.join(str(tmp_path / "lib"), ALBUM, "03.txt"),
+    ]
+
+
+def test_lyrics_no_media(tmp_path):
+    index = build(tmp_path, ["cover.jpg"])
+    assert index.albums == {}
+    assert index.report() == ["total: 0/0 synced (100%), 0 unsynced only"]
@@ -1,11 +1,18 @@
 import pytest
 from typing import Dict, List, Optional, Set
 
-from mediascan import load_files_yaml, Genre, MediaFiles, MediaFile
+from mediascan import load_files_yaml, Genre
+
+from mediatest.crosscheck import FOLDER_NAME_REPLACEMENTS, crosscheck
+from mediatest.records import FileRecord, FileRecordStore, get_snapshot
 
 from tests.test_config import *
 
-files = load_files_yaml(MEDIASCAN_FILES_PATH)
+# files.yaml is converted to a compact record store so that the MediaFile
+# objects can be garbage collected, rules query the store instead
+files = FileRecordStore.from_media_files(load_files_yaml(MEDIASCAN_FILES_PATH).files)
+# one FileRecord view per file, shared by all the parametrized tests below
+records = list(files)
 
 
 NO_ERRORS = "(no errors)"
@@ -44,23 +51,39 @@ def test_per_error(error: str):
     assert error == NO_ERRORS
 
 
+@pytest.mark.parametrize("media_path", LIBS_MEDIA_PATH)
+def test_layout_matches_files_yaml(media_path: str):
+    """Cross-checks the filesystem layout against files.yaml (artist folder vs.
+    albumartist, album folder [year] vs. year, files missing from files.yaml,
+    stale files.yaml entries)"""
+    try:
+        snapshot = get_snapshot(media_path)
+    except OSError as e:
+        pytest.fail(f"Unable to scan {media_path}: {e}")
+    replacements = {**FOLDER_NAME_REPLACEMENTS, **FOLDER_NAME_REPLACEMENT_OVERRIDES}
+    errors = crosscheck(snapshot, files, EXTS_MEDIA, replacements)
+    for error in errors:
+        print(error)
+    assert errors == [], "Filesystem layout does not match files.yaml"
+
+
 @pytest.fixture(scope="session")
-def files_yaml_file() -> MediaFiles:
+def files_yaml_file() -> FileRecordStore:
     return files
 
 
-@pytest.mark.parametrize("file", files.files)
-def test_mediafile_year_gt_zero(file: MediaFile):
+@pytest.mark.parametrize("file", records)
+def test_mediafile_year_gt_zero(file: FileRecord):
     assert file.year > 0, f"{file.path}"
 
 
-@pytest.mark.parametrize("file", files.files)
-def test_mediafile_years_lt_present(file: MediaFile):
+@pytest.mark.parametrize("file", records)
+def test_mediafile_years_lt_present(file: FileRecord):
     assert file.year <= PRESENT_YEAR, f"{file.path}"
 
 
-@pytest.mark.parametrize("file", files.files)
-def test_mediafile_size_gt_min(file: MediaFile):
+@pytest.mark.parametrize("file", records)
+def test_mediafile_size_gt_min(file: FileRecord):
     assert file.size >= MINIMUM_FILESIZE, f"{file.path}"
 
 
@@ -75,8 +98,8 @@ def genre_string_to_enum(s: str) -> Optional[Genre]:
     return None
 
 
-@pytest.mark.parametrize("file", files.files)
-def test_mediafile_allowed_genres(file: MediaFile):
+@pytest.mark.parametrize("file", records)
+def test_mediafile_allowed_genres(file: FileRecord):
     assert file.genre in get_all_genre_strings(), f"{file.path}"
 
 
@@ -110,8 +133,8 @@ def test_lib_genres_all_genres_used():
             pytest.exit("Genre not in any lib genres: " + genre)
 
 
-@pytest.mark.parametrize("file", files.files)
-def test_mediafile_libs_genres_mode_whitelist(file: MediaFile):
+@pytest.mark.parametrize("file", records)
+def test_mediafile_libs_genres_mode_whitelist(file: FileRecord):
     if LIB_GENRES_MODE_BLACKLIST:
         return
     for idx in range(LIB_COUNT):
@@ -122,8 +145,8 @@ def test_mediafile_libs_genres_mode_whitelist(file: MediaFile):
             ), f"{file.path} (genre: {file.genre}) is not allowed by by LIB{idx+1} LIBS_GENRES"
 
 
-@pytest.mark.parametrize("file", files.files)
-def test_mediafile_libs_genres_mode_blacklist(file: MediaFile):
+@pytest.mark.parametrize("file", records)
+def test_mediafile_libs_genres_mode_blacklist(file: FileRecord):
     if not LIB_GENRES_MODE_BLACKLIST:
         return
     for idx in range(LIB_COUNT):
@@ -134,13 +157,13 @@ def test_mediafile_libs_genres_mode_blacklist(file: MediaFile):
             ), f"{file.path} (genre: {file.genre}) is prohibited by LIB{idx+1} LIBS_GENRES"
 
 
-@pytest.mark.parametrize("file", files.files)
-def test_mediafile_artist_is_not_empty(file: MediaFile):
+@pytest.mark.parametrize("file", records)
+def test_mediafile_artist_is_not_empty(file: FileRecord):
     assert len(file.artist) > 0, f"{file.path}"
 
 
-@pytest.mark.parametrize("file", files.files)
-def test_mediafile_albumartist_is_not_empty(file: MediaFile):
+@pytest.mark.parametrize("file", records)
+def test_mediafile_albumartist_is_not_empty(file: FileRecord):
     assert len(file.albumartist) > 0, f"{file.path}"
 
 
@@ -150,7 +173,7 @@ def test_mediafile_albumartist_same_for_every_track_in_every_album():
     but all tracks in a an albums should have the same albumartist e.g. "Dr. Dre"
     """
     albums: Dict[str, str] = {}
-    for file in files.files:
+    for file in files:
         albumkey = f"{file.albumartist} - {file.album} [{file.year}]"
         if albumkey in albums:
             assert albums[albumkey] == file.albumartist
@@ -166,8 +189,8 @@ def run_test_mediafile(tag_type: str, tag_type_2: Optional[str] = None) -> List[
     two albums if the artist is the same for both of them.
     """
     errors: List[str] = []
-    grouped: Dict[str, List[MediaFile]] = {}
-    for file in files.files:
+    grouped: Dict[str, List[FileRecord]] = {}
+    for file in files:
         key = str(getattr(file, tag_type)).upper()
         if key in grouped:
             grouped[key].append(file)
@@ -3,6 +3,11 @@ from __future__ import annotations
 import pytest
 import os
 import re
+from typing import Optional
+
+from mediatest.images import EXT_FORMATS, probe_images
+from mediatest.lyrics import LyricsIndex
+from mediatest.records import FileRecordStore, cache_name, get_snapshot
 
 from tests.test_config import *
 
@@ -12,37 +17,30 @@ def get_file_ext(path: str) -> str:
     return ext.strip(".")
 
 
-def get_path_depth(path: str):
-    return len(path.strip(os.path.sep).split(os.path.sep))
+def get_cache_key(name: str, media_path: str) -> str:
+    """Key for results stored in .pytest_cache between runs"""
+    return f"mediatest/{name}/" + cache_name(media_path)
 
 
-def assert_directory_contains_media(path: str):
+def assert_directory_contains_media(snapshot: FileRecordStore, path: str):
     """Asserts that directory contains at least one media file
     and that directory does not contain subdirectories"""
-    ret = False
-    for f in os.listdir(path):
-        if os.path.isdir(os.path.join(path, f)):
-            assert False
-        elif os.path.isfile(os.path.join(path, f)) and get_file_ext(f) in EXTS_MEDIA:
-            ret = True
-    assert ret
+    assert not snapshot.subdirs_of(path), snapshot.fullpath(path)
+    assert any(
+        snapshot.ext(i) in EXTS_MEDIA for i in snapshot.files_in(path)
+    ), snapshot.fullpath(path)
 
 
-def assert_directory_contains_subdirectories(path: str):
+def assert_directory_contains_subdirectories(snapshot: FileRecordStore, path: str):
     """Asserts that directory contains at least one subdirectory
     and that directory does not contain any files"""
-    ret = False
-    for f in os.listdir(path):
-        if os.path.isfile(os.path.join(path, f)):
-            assert False
-        elif os.path.isdir(os.path.join(path, f)):
-            ret = True
-    assert ret
+    assert not snapshot.files_in(path), snapshot.fullpath(path)
+    assert snapshot.subdirs_of(path), snapshot.fullpath(path)
 
 
-def directory_contains_cover_jpg(path: str) -> bool:
+def directory_contains_cover_jpg(snapshot: FileRecordStore, path: str) -> bool:
     """Returns whether directory contains cover.jpg or not"""
-    return "cover.jpg" in os.listdir(path)
+    return any(snapshot.name(i) == "cover.jpg" for i in snapshot.files_in(path))
 
 
 def string_contains_trailing_space(s: str) -> bool:
@@ -51,13 +49,19 @@ def string_contains_trailing_space(s: str) -> bool:
     return bool(s != s.strip())
 
 
+def do_test_no_unreadable_files(media_path: str):
+    """Dangling symlinks, unreadable dirs, etc. are left out of the snapshot"""
+    snapshot = get_snapshot(media_path)
+    for error in snapshot.errors:
+        print(error)
+    assert snapshot.errors == [], "One or more unreadable files or dirs"
+
+
 def do_test_allowed_exts(media_path: str):
-    count = 0
-    for _, _, files in os.walk(media_path, topdown=False):
-        for name in files:
-            ext = get_file_ext(name)
-            assert ext in ALLOWED_EXTS, f"{name} not in allowed extensions"
-    print(count)
+    snapshot = get_snapshot(media_path)
+    for i in range(len(snapshot)):
+        assert snapshot.ext(i) in ALLOWED_EXTS, f"{snapshot.name(i)} not in allowed extensions"
+    print(len(snapshot))
 
 
 # '’' is prohibited because it's problematic with ID3 tags (converts to '?' if ripped from CD),
@@ -73,13 +77,14 @@ FILENAME_PROHIBITED_CHARS = "’？?"
 
 def do_test_filenames(media_path: str):
     failing = []
-    for _, _, files in os.walk(media_path, topdown=False):
-        for name in files:
-            for c in FILENAME_PROHIBITED_CHARS:
-                if c in name:
-                    fail = f"character {c} not allowed in filename {name}"
-                    print(fail)
-                    failing.append(fail)
+    snapshot = get_snapshot(media_path)
+    for i in range(len(snapshot)):
+        name = snapshot.name(i)
+        for c in FILENAME_PROHIBITED_CHARS:
+            if c in name:
+                fail = f"character {c} not allowed in filename {name}"
+                print(fail)
+                failing.append(fail)
     print(f"do_test_filenames fail count: {len(failing)}")
     assert failing == []
 
@@ -89,22 +94,22 @@ def do_test_media_file_count(
 ):
     count_media = 0
     count_mp3 = 0
-    count_m4a = 1
+    count_m4a = 0
     count_lrc = 0  # synced lyrics
     count_txt = 0  # unsynced lyrics
-    for _, _, files in os.walk(media_path, topdown=False):
-        for name in files:
-            ext = get_file_ext(name)
-            if ext in EXTS_MEDIA:
-                count_media += 1
-            if ext == "mp3":
-                count_mp3 += 1
-            elif ext == "m4a":
-                count_m4a += 1
-            elif ext == "lrc":
-                count_lrc += 1
-            elif ext == "txt":
-                count_txt += 1
+    snapshot = get_snapshot(media_path)
+    for i in range(len(snapshot)):
+        ext = snapshot.ext(i)
+        if ext in EXTS_MEDIA:
+            count_media += 1
+        if ext == "mp3":
+            count_mp3 += 1
+        elif ext == "m4a":
+            count_m4a += 1
+        elif ext == "lrc":
+            count_lrc += 1
+        elif ext == "txt":
+            count_txt += 1
     print("count_mp3={}".format(count_mp3))
     print("count_m4a={}".format(count_m4a))
     print("count_media={}".format(count_media))
@@ -115,21 +120,29 @@ def do_test_media_file_count(
     assert count_lrc == expected_lrc_count
 
 
+def do_test_lyrics_coverage(media_path: str):
+    index = LyricsIndex.build(get_snapshot(media_path), EXTS_MEDIA)
+    for line in index.report():
+        print(line)
+    orphans = index.orphans()
+    for path in orphans:
+        print("Lyrics file without media file: {}".format(path))
+    if LYRICS_FAIL_ON_ORPHANS:
+        assert orphans == [], "One or more lyrics files without a matching media file"
+
+
 def do_test_no_empty_dirs(media_path: str):
-    base_depth = get_path_depth(media_path)
-    for root, dirs, _ in os.walk(media_path, topdown=False):
-        for name in dirs:
-            fullpath = os.path.join(root, name)
-            current_depth = get_path_depth(fullpath)
-            relative_depth = current_depth - base_depth
-            # 1 = artist dir
-            if relative_depth == 1:
-                assert_directory_contains_subdirectories(fullpath)
-            # 2 = album [year] dir
-            elif relative_depth == 2:
-                assert_directory_contains_media(fullpath)
-            else:
-                assert False, "folder nested too deep: {}".format(fullpath)
+    snapshot = get_snapshot(media_path)
+    for path in snapshot.directory_paths():
+        relative_depth = snapshot.depth(path)
+        # 1 = artist dir
+        if relative_depth == 1:
+            assert_directory_contains_subdirectories(snapshot, path)
+        # 2 = album [year] dir
+        elif relative_depth == 2:
+            assert_directory_contains_media(snapshot, path)
+        else:
+            assert False, "folder nested too deep: {}".format(snapshot.fullpath(path))
 
 
 # @pytest.mark.skip(reason="wip")
@@ -137,35 +150,34 @@ def do_test_album_dir_name(media_path: str):
     # prohibit chars not allowed in windows filenames
     # and other problematic characters
     album_pattern = re.compile(r'[^:\?&#%{}\\\.`$!<>\*"+|=]*\[\d+(-\d+)?\]')
-    base_depth = get_path_depth(media_path)
+    snapshot = get_snapshot(media_path)
     count = 0
     match_count = 0
-    for root, dirs, _ in os.walk(media_path, topdown=False):
-        for name in dirs:
-            fullpath = os.path.join(root, name)
-            current_depth = get_path_depth(fullpath)
-            # 1 = artist dir
-            # 2 = album [year] dir
-            if current_depth - base_depth == 2:
-                count += 1
-                if album_pattern.match(name) and not string_contains_trailing_space(
-                    name
-                ):
-                    # test album year format (4 digits)
-                    album_year = 0
-                    try:
-                        tokens: List[str] = re.findall(r"\[(\d{4})\]", name)
-                        album_year = int(tokens[-1])
-                        match_count += 1
-                        print(album_year)
-                    except Exception:
-                        print(
-                            "bad album dir name format (invalid year): {}".format(
-                                fullpath
-                            )
+    for path in snapshot.directory_paths():
+        # 1 = artist dir
+        # 2 = album [year] dir
+        if snapshot.depth(path) == 2:
+            count += 1
+            name = os.path.basename(path)
+            fullpath = snapshot.fullpath(path)
+            if album_pattern.match(name) and not string_contains_trailing_space(
+                name
+            ):
+                # test album year format (4 digits)
+                album_year = 0
+                try:
+                    tokens: List[str] = re.findall(r"\[(\d{4})\]", name)
+                    album_year = int(tokens[-1])
+                    match_count += 1
+                    print(album_year)
+                except Exception:
+                    print(
+                        "bad album dir name format (invalid year): {}".format(
+                            fullpath
                         )
-                else:
-                    print("bad album dir name format: {}".format(fullpath))
+                    )
+            else:
+                print("bad album dir name format: {}".format(fullpath))
     print(
         "test_dir_name: bad album dir format: {} out of {}".format(
             count - match_count, count
@@ -183,21 +195,18 @@ def do_test_album_dir_name(media_path: str):
 
 
 def do_test_album_cover_jpg(media_path: str):
-    base_depth = get_path_depth(media_path)
+    snapshot = get_snapshot(media_path)
     count = 0
     match_count = 0
-    for root, dirs, _ in os.walk(media_path, topdown=False):
-        for name in dirs:
-            fullpath = os.path.join(root, name)
-            current_depth = get_path_depth(fullpath)
-            # 1 = artist dir
-            # 2 = album [year] dir
-            if current_depth - base_depth == 2:
-                count += 1
-                if directory_contains_cover_jpg(fullpath):
-                    match_count += 1
-                else:
-                    print("Missing cover.jpg dir: {}".format(fullpath))
+    for path in snapshot.directory_paths():
+        # 1 = artist dir
+        # 2 = album [year] dir
+        if snapshot.depth(path) == 2:
+            count += 1
+            if directory_contains_cover_jpg(snapshot, path):
+                match_count += 1
+            else:
+                print("Missing cover.jpg dir: {}".format(snapshot.fullpath(path)))
     print(
         "test_album_cover_jpg: Missing cover.jpg dir: {} out of {}".format(
             count - match_count, count
@@ -211,9 +220,55 @@ def do_test_album_cover_jpg(media_path: str):
     assert count == match_count, "One or more album dirs missing cover.jpg"
 
 
+def do_test_cover_art(media_path: str, cache: Optional[pytest.Cache]):
+    """Validates image files by reading their headers only (no decoding).
+    Probe results are cached by (size, mtime) in .pytest_cache"""
+    snapshot = get_snapshot(media_path)
+    images = [
+        (snapshot.relpath(i), snapshot.sizes[i], snapshot.mtimes[i])
+        for i in range(len(snapshot))
+        if snapshot.ext(i) in EXT_FORMATS
+    ]
+    key = get_cache_key("images", media_path)
+    probed = probe_images(
+        [(snapshot.fullpath(path), size, mtime) for path, size, mtime in images],
+        {snapshot.fullpath(k): v for k, v in cache.get(key, {}).items()} if cache else None,
+    )
+    if cache:
+        cache.set(key, {path: probed[snapshot.fullpath(path)] for path, _, _ in images})
+    failing = []
+    for path, size, _ in images:
+        fullpath = snapshot.fullpath(path)
+        _, _, fmt, width, height = probed[fullpath]
+        name = os.path.basename(path)
+        expected = EXT_FORMATS[get_file_ext(name)]
+        if not fmt:
+            failing.append(f"unreadable image (expected {expected}): {fullpath}")
+            continue
+        if fmt != expected:
+            failing.append(f"mislabeled image ({fmt}, expected {expected}): {fullpath}")
+        if os.path.splitext(name)[0] != "cover":
+            continue
+        if min(width, height) < COVER_MIN_DIMENSION:
+            failing.append(f"cover art too small ({width}x{height}): {fullpath}")
+        if max(width, height) > COVER_MAX_DIMENSION:
+            failing.append(f"cover art too large ({width}x{height}): {fullpath}")
+        if size > COVER_MAX_FILESIZE:
+            failing.append(f"cover art file too large ({size} bytes): {fullpath}")
+    for fail in failing:
+        print(fail)
+    print(f"do_test_cover_art fail count: {len(failing)} out of {len(images)} images")
+    assert failing == []
+
+
 # begin filesystem tests
 
 
+@pytest.mark.parametrize("media_path", LIBS_MEDIA_PATH)
+def test_no_unreadable_files(media_path: str):
+    do_test_no_unreadable_files(media_path)
+
+
 @pytest.mark.parametrize("media_path", LIBS_MEDIA_PATH)
 def test_allowed_exts(media_path: str):
     do_test_allowed_exts(media_path)
@@ -233,6 +288,11 @@ def test_media_file_count(lib_idx: int):
     )
 
 
+@pytest.mark.parametrize("media_path", LIBS_MEDIA_PATH)
+def test_lyrics_coverage(media_path: str):
+    do_test_lyrics_coverage(media_path)
+
+
 @pytest.mark.parametrize("media_path", LIBS_MEDIA_PATH)
 def test_no_empty_dirs(media_path: str):
     do_test_allowed_exts(media_path)
@@ -248,12 +308,14 @@ def test_album_cover_jpg(media_path: str):
     do_test_album_cover_jpg(media_path)
 
 
+@pytest.mark.parametrize("media_path", LIBS_MEDIA_PATH)
+def test_cover_art(media_path: str, pytestconfig: pytest.Config):
+    # no cache with -p no:cacheprovider
+    do_test_cover_art(media_path, getattr(pytestconfig, "cache", None))
+
+
 def get_lib_total_filesize_gb(media_path: str) -> float:
-    size = 0
-    for path, _, files in os.walk(media_path):
-        for f in files:
-            fp = os.path.join(path, f)
-            size += os.stat(fp).st_size
+    size = get_snapshot(media_path).total_size()
     print(size)
     size_gb = size / GIGABYTE
     print("size_gb=", size_gb)
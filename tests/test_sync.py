@@ -0,0 +1,201 @@
+import os
+import shutil
+from collections import namedtuple
+from types import SimpleNamespace
+
+import pytest
+
+from mediatest import mediatest
+from mediatest.records import FileRecordStore, snapshot_cache_path
+from mediatest.sync import MTIME_TOLERANCE_NS, check_fits, partial_hash, plan_sync
+
+ALBUM = os.path.join("A", "Alb [2000]")
+MTIME_NS = 1_700_000_000 * 10**9
+
+
+def write(root, relpath: str, data: bytes, mtime_ns: int = MTIME_NS):
+    path = os.path.join(root, relpath)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+@pytest.fixture
+def libs(tmp_path):
+    """Source lib and a target device which was synced before"""
+    source = str(tmp_path / "lib")
+    target = str(tmp_path / "device")
+    for root in (source, target):
+        write(root, os.path.join(ALBUM, "01.mp3"), b"1" * 1000)
+        write(root, os.path.join(ALBUM, "cover.jpg"), b"c" * 100)
+    return source, target
+
+
+def snapshots(source: str, target: str):
+    return FileRecordStore.from_filesystem(source), FileRecordStore.from_filesystem(target)
+
+
+def test_plan_sync_unchanged(libs):
+    plan = plan_sync(*snapshots(*libs))
+    assert plan.lines() == []
+    assert plan.unchanged == 2
+    assert plan.copy_bytes == 0 and plan.freed_bytes == 0
+
+
+def test_plan_sync_copy_update_delete(libs):
+    source, target = libs
+    write(source, os.path.join(ALBUM, "02.mp3"), b"2" * 500)  # new
+    write(source, os.path.join(ALBUM, "01.mp3"), b"1" * 1200, MTIME_NS + 10**9)  # retagged
+    write(target, os.path.join(ALBUM, "old.mp3"), b"o" * 300)  # removed from the lib
+    plan = plan_sync(*snapshots(source, target))
+    assert plan.copy == [(os.path.join(ALBUM, "02.mp3"), 500)]
+    assert plan.update == [(os.path.join(ALBUM, "01.mp3"), 1200)]
+    assert plan.delete == [(os.path.join(ALBUM, "old.mp3"), 300)]
+    assert plan.unchanged == 1
+    assert plan.lines()[0] == "delete " + os.path.join(ALBUM, "old.mp3")
+    assert plan.copy_bytes == 1700
+    # old.mp3 deleted and the old 01.mp3 replaced
+    assert plan.freed_bytes == 300 + 1000
+    assert plan.source_bytes == 1200 + 500 + 100
+
+
+def test_plan_sync_mtime_tolerance(libs):
+    source, target = libs
+    # e.g. FAT/exFAT rounds mtimes to 2 seconds
+    write(target, os.path.join(ALBUM, "01.mp3"), b"1" * 1000, MTIME_NS + MTIME_TOLERANCE_NS)
+    assert plan_sync(*snapshots(source, target)).update == []
+    write(target, os.path.join(ALBUM, "01.mp3"), b"1" * 1000, MTIME_NS + MTIME_TOLERANCE_NS + 1)
+    assert plan_sync(*snapshots(source, target)).update == [(os.path.join(ALBUM, "01.mp3"), 1000)]
+
+
+def test_plan_sync_hash(libs):
+    source, target = libs
+    # copied without preserving mtime, same contents
+    write(target, os.path.join(ALBUM, "01.mp3"), b"1" * 1000, MTIME_NS + 60 * 10**9)
+    # retagged, same size
+    write(source, os.path.join(ALBUM, "cover.jpg"), b"C" * 100, MTIME_NS + 60 * 10**9)
+    plan = plan_sync(*snapshots(source, target), use_hash=True)
+    assert plan.update == [(os.path.join(ALBUM, "cover.jpg"), 100)]
+    assert plan.unchanged == 1
+
+
+def test_partial_hash(tmp_path):
+    size = 300 * 1024
+    write(tmp_path, "a", b"a" * size)
+    write(tmp_path, "b", b"a" * (size - 1) + b"b")
+    write(tmp_path, "c", b"a" * 100 * 1024 + b"c" + b"a" * (200 * 1024 - 1))
+    a, b, c = (partial_hash(str(tmp_path / name), size) for name in "abc")
+    assert a != b
+    # only the start and the end of the file are hashed
+    assert a == c
+
+
+def test_manifest_round_trip(libs, tmp_path):
+    source, _ = libs
+    snapshot = FileRecordStore.from_filesystem(source)
+    manifest = str(tmp_path / "device.json")
+    snapshot.save(manifest, root="")
+    loaded = FileRecordStore.load(manifest)
+    assert loaded.root == ""
+    assert [r.relpath for r in loaded] == [r.relpath for r in snapshot]
+    assert list(loaded.sizes) == list(snapshot.sizes)
+    assert list(loaded.mtimes) == list(snapshot.mtimes)
+    assert loaded.directory_paths() == snapshot.directory_paths()
+    assert plan_sync(snapshot, loaded).lines() == []
+
+
+def test_manifest_target_with_hash(libs, tmp_path):
+    """A manifest has no file contents, hashing it must not compare the
+    source file with itself and report a retagged file as unchanged"""
+    source, _ = libs
+    snapshot = FileRecordStore.from_filesystem(source)
+    for root in ("", source):  # manifests saved with and without a root
+        manifest = str(tmp_path / "device.json")
+        snapshot.save(manifest, root=root)
+        write(source, os.path.join(ALBUM, "01.mp3"), b"X" * 1000, MTIME_NS + 60 * 10**9)
+        updated = FileRecordStore.from_filesystem(source)
+        target = FileRecordStore.load(manifest)
+        assert plan_sync(updated, target).update == [(os.path.join(ALBUM, "01.mp3"), 1000)]
+        with pytest.raises(ValueError):
+            plan_sync(updated, target, use_hash=True)
+
+
+def test_check_fits_limit(libs):
+    plan = plan_sync(*snapshots(*libs))
+    assert check_fits(plan, 1100) == []
+    assert len(check_fits(plan, 1099)) == 1
+
+
+def test_check_fits_free_space(libs, monkeypatch):
+    source, target = libs
+    write(source, os.path.join(ALBUM, "02.mp3"), b"2" * 500)
+    write(target, os.path.join(ALBUM, "old.mp3"), b"o" * 300)
+    plan = plan_sync(*snapshots(source, target))
+    DiskUsage = namedtuple("DiskUsage", "total used free")
+    # 200 free + 300 freed by deleting old.mp3 first
+    monkeypatch.setattr(shutil, "disk_usage", lambda path: DiskUsage(10**6, 10**6, 200))
+    assert check_fits(plan, 10**6, target) == []
+    monkeypatch.setattr(shutil, "disk_usage", lambda path: DiskUsage(10**6, 10**6, 199))
+    assert len(check_fits(plan, 10**6, target)) == 1
+    # free space isn't checked for a manifest target
+    assert check_fits(plan, 10**6, os.path.join(target, "device.json")) == []
+
+
+def test_stale_dirs(libs):
+    source, _ = libs
+    snapshot = FileRecordStore.from_filesystem(source)
+    assert snapshot.stale_dirs() == []
+    write(source, os.path.join("B", "New [2001]", "01.mp3"), b"1")
+    assert snapshot.stale_dirs() == ["B", os.path.join("B", "New [2001]")]
+
+
+def test_changed_files(libs):
+    source, _ = libs
+    snapshot = FileRecordStore.from_filesystem(source)
+    assert snapshot.changed_files() == []
+    # retagged in place, the album dir mtime doesn't change
+    write(source, os.path.join(ALBUM, "01.mp3"), b"X" * 1000, MTIME_NS + 60 * 10**9)
+    os.remove(os.path.join(source, ALBUM, "cover.jpg"))
+    assert snapshot.changed_files() == [os.path.join(ALBUM, "01.mp3"), os.path.join(ALBUM, "cover.jpg")]
+
+
+def test_load_source_snapshot_changed_files(libs, tmp_path):
+    source, _ = libs
+    cache_dir = str(tmp_path / "cache")
+    os.makedirs(cache_dir)
+    FileRecordStore.from_filesystem(source).save(snapshot_cache_path(cache_dir, source))
+    write(source, os.path.join(ALBUM, "01.mp3"), b"X" * 1200, MTIME_NS + 60 * 10**9)
+    snapshot = mediatest.load_source_snapshot(source, cache_dir, rescan=False)
+    assert sorted(snapshot.sizes) == [100, 1200]
+
+
+@pytest.fixture
+def cli(libs, tmp_path, monkeypatch):
+    source, _ = libs
+    config = SimpleNamespace(LIBS_MEDIA_PATH=[source], LIBS_TOTAL_FILESIZE_LIMIT_GB=[1], GIGABYTE=1024**3)
+    monkeypatch.setattr(mediatest, "load_config", lambda: config)
+    return lambda *argv: mediatest.main(["sync-plan", "--cache-dir", str(tmp_path / "cache"), *argv])
+
+
+def test_sync_plan_cli(libs, cli, capsys):
+    assert cli("0", libs[1]) == 0
+    assert "copy: 0, update: 0, delete: 0, unchanged: 2" in capsys.readouterr().out
+
+
+def test_sync_plan_cli_errors(libs, cli, tmp_path, capsys):
+    source, _ = libs
+    # manifest path mistyped
+    assert cli("0", str(tmp_path / "missing.json")) == 2
+    assert capsys.readouterr().out.splitlines()[-1].startswith("Unable to plan sync: ")
+    # not a manifest
+    with open(tmp_path / "bad.json", "w") as f:
+        f.write("{")
+    assert cli("0", str(tmp_path / "bad.json")) == 2
+    # hashing the lib against itself
+    assert cli("0", source, "--hash") == 2
+    assert capsys.readouterr().out.splitlines()[-1].startswith("Unable to plan sync: ")
+    with pytest.raises(SystemExit) as e:
+        cli("1", libs[1])
+    assert e.value.code == 2
+    assert "invalid choice: 1" in capsys.readouterr().err